@@ -20,3 +20,8 @@ if __name__ == '__main__':
     print('Device observations:')
     pprint(do)
     print()
+
+    print('Streamed device observations (CSV):')
+    for ob in testrest.stream_device_observations(test_device, day_offset=1, format='csv'):
+        pprint(ob)
+    print()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+import json
+
+# Import module for testing
+import weatherflow.api
+from weatherflow.api.rest import RestError
+
+
+class FakeResponse:
+    """
+    Stand in for a streamed requests.Response which returns the body one chunk at a time
+    """
+    def __init__(self, body, content_type='application/json'):
+        self.body = body.encode('utf-8')
+        self.headers = {'content-type': content_type}
+        self.encoding = 'ISO-8859-1' if content_type.startswith('text/') else None
+        self.closed = False
+
+    def iter_content(self, chunk_size=1, decode_unicode=False):
+        # Decode the whole body at once so multi-byte characters are not split, then chunk the text
+        text = self.body.decode(self.encoding or 'utf-8')
+        for i in range(0, len(text), chunk_size):
+            yield text[i:i + chunk_size]
+
+    def close(self):
+        self.closed = True
+
+
+def open_stream(body, content_type='application/json', **kwargs):
+    """
+    Open an observation stream over a fake response body, read one character at a time
+    :param body: Response body to stream
+    :param content_type: Content type header of the fake response
+    :return: Observation stream and the fake response
+    """
+    response = FakeResponse(body, content_type)
+    rest = weatherflow.api.Rest(api_key='test')
+    rest._get = lambda url, headers=None, params=None, stream=False: response
+    return rest.stream_device_observations(1, chunk_size=1, **kwargs), response
+
+
+def stream(body, content_type='application/json', **kwargs):
+    """
+    Stream all observations from a fake response body, one character at a time
+    :param body: Response body to stream
+    :param content_type: Content type header of the fake response
+    :return: List of observations and the fake response
+    """
+    observations, response = open_stream(body, content_type, **kwargs)
+    return list(observations), response
+
+
+if __name__ == '__main__':
+    air_obs = [[1600000000, 1013.2, 21.5, 55, 0, 0, 2.65, 1], [1600000060, 1013.1, 21.4, 56, 0, 0, 2.65, None]]
+
+    print('JSON with type before obs')
+    body = json.dumps({'status': {'status_code': 0}, 'device_id': 1, 'type': 'obs_air', 'obs': air_obs})
+    observations, response = stream(body)
+    assert len(observations) == 2
+    assert observations[0]['air_temperature'] == 21.5
+    assert observations[1]['report_interval'] is None
+    assert response.closed
+
+    print('JSON without data keys')
+    observations, response = stream(body, auto_add_data_keys=False)
+    assert observations == air_obs
+
+    print('JSON with type after obs')
+    body = '{"device_id": 1, "obs": %s, "type": "obs_air"}' % json.dumps(air_obs)
+    observations, response = stream(body)
+    assert observations == air_obs
+
+    print('JSON with obs null')
+    observations, response = stream('{"type": "obs_air", "obs" : null}')
+    assert observations == []
+
+    print('JSON with a single flat observation')
+    observations, response = stream(json.dumps({'type': 'obs_air', 'obs': air_obs[0]}))
+    assert len(observations) == 1
+    assert observations[0]['timestamp'] == 1600000000
+
+    print('JSON with a flat observation split across chunks without data keys')
+    observations, response = stream('{"obs":[123,456]}', auto_add_data_keys=False)
+    assert observations == [[123, 456]]
+
+    print('JSON with empty obs')
+    observations, response = stream('{"type": "obs_air", "obs": []}')
+    assert observations == []
+
+    print('JSON without obs')
+    try:
+        stream('{"status": {"status_code": 404, "status_message": "NOT FOUND"}}')
+        raise AssertionError('RestError not raised')
+    except RestError:
+        pass
+
+    print('JSON with obs not an array')
+    try:
+        stream('{"type": "obs_air", "obs": "none"}')
+        raise AssertionError('RestError not raised')
+    except RestError:
+        pass
+
+    print('JSON truncated')
+    try:
+        stream('{"type": "obs_air", "obs": [[1, 2')
+        raise AssertionError('RestError not raised')
+    except RestError:
+        pass
+
+    print('CSV with CRLF line endings')
+    csv_type = 'text/csv'
+    body = 'type,serial_number,epoch,air_temperature,code\r\nobs_air,AR-00001,1600000000,21.5,NaN\r\n' \
+           'obs_air,AR-00001,1600000060,,0123\r\n'
+    observations, response = stream(body, csv_type, format='csv')
+    assert observations == [{'type': 'obs_air', 'serial_number': 'AR-00001', 'epoch': 1600000000,
+                             'air_temperature': 21.5, 'code': 'NaN'},
+                            {'type': 'obs_air', 'serial_number': 'AR-00001', 'epoch': 1600000060,
+                             'air_temperature': None, 'code': '0123'}]
+    assert response.closed
+
+    print('CSV without data keys yields header first')
+    observations, response = stream(body, csv_type, format='csv', auto_add_data_keys=False)
+    assert observations[0] == ['type', 'serial_number', 'epoch', 'air_temperature', 'code']
+    assert observations[1] == ['obs_air', 'AR-00001', 1600000000, 21.5, 'NaN']
+
+    print('CSV with blank line in quoted field and UTF-8 without charset')
+    observations, response = stream('type,note\nobs_air,"a\n\nb \u00b0C"\n\n', csv_type, format='csv')
+    assert observations == [{'type': 'obs_air', 'note': 'a\n\nb \u00b0C'}]
+
+    print('Closing a stream without iterating')
+    observations, response = open_stream(body, csv_type, format='csv')
+    with observations:
+        pass
+    assert response.closed
+
+    print('Unsupported format')
+    try:
+        weatherflow.api.Rest(api_key='test').stream_device_observations(1, format='xml')
+        raise AssertionError('RestError not raised')
+    except RestError:
+        pass
+
+    print('Finished main function')
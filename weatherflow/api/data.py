@@ -1,3 +1,5 @@
+import math
+
 # Define format for REST API fields so we can convert data from integer arrays to dictionaries (e.g. observation data)
 REST_DATA_FORMAT = {'obs_air': {'obs': (    'timestamp',
                                             'barometric_pressure',
@@ -47,6 +49,9 @@ REST_DATA_FORMAT = {'obs_air': {'obs': (    'timestamp',
                                             'precip_minutes_local_yesterday_final',
                                             'precip_analyze_type')}}
 
+# CSV columns returned by the REST API which hold text, all other columns are converted to numbers where possible
+CSV_STRING_FIELDS = {'type', 'serial_number', 'hub_sn', 'source', 'firmware_revision'}
+
 # TODO: Define format for Websocket fields so we can convert data from integer arrays to dictionaries (e.g. observation data)
 WS_DATA_FORMAT = {}
 
@@ -163,5 +168,52 @@ def convert_list(data, value_names):
     return new_data
 
 
+def convert_csv_row(data, value_names):
+    """
+    Convert values within a list of CSV strings to numbers where possible, empty values become None.  Columns in
+    CSV_STRING_FIELDS (e.g. type or serial numbers) are left as strings
+    :param data: List of strings read from a CSV row
+    :param value_names: List of column names from the CSV header
+    :return: List of converted values
+    """
+    new_data = []
+    for i, value in enumerate(data):
+        if i < len(value_names) and value_names[i] in CSV_STRING_FIELDS:
+            new_data.append(value)
+        elif value == '':
+            new_data.append(None)
+        else:
+            new_data.append(convert_number(value))
+
+    return new_data
+
+
+def convert_number(value):
+    """
+    Convert a string to an integer or finite float, leaving it unchanged if it is not a number or has leading zeros
+    (e.g. codes such as 0123)
+    :param value: String to convert
+    :return: Converted value
+    """
+    digits = value.strip().lstrip('+-')
+    if len(digits) > 1 and digits[0] == '0' and digits[1].isdigit():
+        return value
+
+    try:
+        return int(value)
+    except ValueError:
+        pass
+
+    try:
+        number = float(value)
+    except ValueError:
+        return value
+
+    if not math.isfinite(number):
+        return value
+
+    return number
+
+
 class DataFormatError(Exception):
     pass
@@ -1,9 +1,24 @@
+import csv
+import json
+import re
 import requests
-from .data import add_data_keys
+from .data import add_data_keys, convert_list, convert_csv_row, REST_DATA_FORMAT
 
 # Define REST API parameters
 _REST_BASE_URL = 'https://swd.weatherflow.com/swd/rest'
 
+# Size of HTTP body chunks read at a time when streaming observations
+_STREAM_CHUNK_SIZE = 8192
+
+# Patterns used to locate fields in a streamed JSON observation response before the full body has arrived
+_JSON_TYPE_PATTERN = re.compile(r'"type"\s*:\s*"([^"]*)"')
+_JSON_OBS_PATTERN = re.compile(r'"obs"\s*:\s*')
+
+# Maximum characters of a streamed JSON response buffered while looking for "obs" or a single observation, and how
+# much of the buffer to rescan for "obs" when a new chunk arrives
+_STREAM_HEADER_LIMIT = 65536
+_STREAM_OBS_KEY_LENGTH = 64
+
 
 class Rest:
     def __init__(self, access_token=None, api_key=None, station_id=None, device_id=None, base_url=_REST_BASE_URL,
@@ -62,36 +77,248 @@ class Rest:
                             You also need to send "time_start".
                             This field pair is optional.
                             If the request does not contain any time filters only the latest observation is returned
-        :param format: Use format=csv to return a CSV response type.
+        :param format: Only JSON is supported, use stream_device_observations for format=csv
         :param auto_add_data_keys: If true, data arrays will be converted from integer arrays to dictionaries
         :return: JSON from WeatherFlow API
         """
+        if format and format != 'json':
+            raise RestError('Unsupported format: ' + str(format) + ', use stream_device_observations for CSV')
+
         if not device_id:
             device_id = self.device_id
 
         url = self.base_url + '/observations/device/' + str(device_id)
-        headers = self.base_headers
-        params = self.base_params
-        if day_offset:
+        headers = dict(self.base_headers)
+        params = dict(self.base_params)
+        if day_offset is not None:
             params['day_offset'] = day_offset
-        if time_start:
+        if time_start is not None:
             params['time_start'] = time_start
-        if time_end:
+        if time_end is not None:
             params['time_end'] = time_end
-        if format:
-            params['format'] = format
 
         result = self._get(url, headers=headers, params=params)
         try:
             result = result.json()
         except:
-            raise RestError('Issue parsing JSON received from WeatherFlow API: ' + result)
+            raise RestError('Issue parsing JSON received from WeatherFlow API: ' + result.text)
 
         if auto_add_data_keys:
             return add_data_keys(result, 'rest')
         else:
             return result
 
+    def stream_device_observations(self, device_id=None, day_offset=None, time_start=None, time_end=None,
+                                   format='json', auto_add_data_keys=True, chunk_size=_STREAM_CHUNK_SIZE):
+        """
+        Stream observations for a Device(Air,Sky,Tempest), yielding each observation as soon as it has been received
+        rather than buffering the entire response first.  This keeps memory usage constant for large multi-day pulls.
+
+        Takes the same filters as get_device_observations.  Only the observations are yielded, other response fields
+        (status, summary, etc.) are skipped.  The request is made when this method is called, so arguments and HTTP
+        errors raise immediately rather than on first iteration.
+        :param device_id: device to acquire data for
+        :param day_offset: TIME FILTER - Get an entire day of observations by UTC day offset.
+        :param time_start: TIME FILTER - Time range start time epoch seconds UTC, requires "time_end".
+        :param time_end: TIME FILTER - Time range end time epoch seconds UTC, requires "time_start".
+        :param format: Response type to request and parse, either json or csv
+        :param auto_add_data_keys: If true, each observation will be converted from a value list to a dictionary.
+                                   For JSON the device type must appear before "obs" in the response, otherwise
+                                   observations are yielded as lists.  For CSV, if false, the header row is yielded
+                                   first so the column order is known
+        :param chunk_size: Number of bytes to read from the HTTP body at a time
+        :return: ObservationStream iterating one observation at a time, the connection is closed once it is exhausted,
+                 otherwise call close() or use it in a with statement
+        """
+        if format not in ('json', 'csv'):
+            raise RestError('Unsupported stream format: ' + str(format))
+
+        if not device_id:
+            device_id = self.device_id
+
+        url = self.base_url + '/observations/device/' + str(device_id)
+        headers = dict(self.base_headers)
+        params = dict(self.base_params)
+        if day_offset is not None:
+            params['day_offset'] = day_offset
+        if time_start is not None:
+            params['time_start'] = time_start
+        if time_end is not None:
+            params['time_end'] = time_end
+        if format == 'csv':
+            headers['Accept'] = 'text/csv'
+            params['format'] = format
+
+        result = self._get(url, headers=headers, params=params, stream=True)
+        if format == 'csv':
+            # Without a charset requests assumes ISO-8859-1 for text types, WeatherFlow sends UTF-8
+            if 'charset' not in result.headers.get('content-type', ''):
+                result.encoding = 'utf-8'
+            rows = self._stream_csv_observations(result, auto_add_data_keys, chunk_size)
+        else:
+            if result.encoding is None:
+                result.encoding = 'utf-8'
+            rows = self._stream_json_observations(result, auto_add_data_keys, chunk_size)
+        return ObservationStream(result, rows)
+
+    @staticmethod
+    def _iter_lines(chunks):
+        """
+        Split streamed text chunks into lines, keeping line endings so the csv module can handle CR LF and quoting
+        :param chunks: Iterable of decoded text chunks
+        :return: Generator yielding one line at a time
+        """
+        buffer = ''
+        for chunk in chunks:
+            buffer += chunk
+            lines = buffer.split('\n')
+            buffer = lines.pop()
+            for line in lines:
+                yield line + '\n'
+        if buffer:
+            yield buffer
+
+    @staticmethod
+    def _stream_csv_observations(result, auto_add_data_keys, chunk_size):
+        """
+        Parse a streamed CSV observation response, the first line of which is a header naming each column
+        :param result: Streaming response from WeatherFlow API
+        :param auto_add_data_keys: If true, rows are yielded as dictionaries keyed by the header, otherwise the header
+                                   is yielded first followed by rows as lists
+        :param chunk_size: Number of bytes to read from the HTTP body at a time
+        :return: Generator yielding one observation at a time
+        """
+        lines = Rest._iter_lines(result.iter_content(chunk_size=chunk_size, decode_unicode=True))
+        reader = csv.reader(lines)
+        header = None
+        try:
+            for row in reader:
+                if not row:
+                    continue
+                if header is None:
+                    header = row
+                    if not auto_add_data_keys:
+                        yield header
+                    continue
+                row = convert_csv_row(row, header)
+                if auto_add_data_keys:
+                    row = convert_list(row, header)
+                yield row
+        except csv.Error:
+            raise RestError('Issue parsing CSV received from WeatherFlow API')
+
+    @staticmethod
+    def _stream_json_observations(result, auto_add_data_keys, chunk_size):
+        """
+        Incrementally parse a streamed JSON observation response, decoding each entry of the "obs" array as soon as
+        it is complete.  The device type must appear before "obs" in the response for keys to be added.
+        :param result: Streaming response from WeatherFlow API
+        :param auto_add_data_keys: If true, observations are converted to dictionaries using the REST data format
+        :param chunk_size: Number of bytes to read from the HTTP body at a time
+        :return: Generator yielding one observation at a time
+        """
+        decoder = json.JSONDecoder()
+        chunks = result.iter_content(chunk_size=chunk_size, decode_unicode=True)
+        buffer = ''
+        search_start = 0
+        value_names = None
+
+        # Read until the value of "obs", noting the device type along the way.  Only a limited amount of the response
+        # is read, anything larger without "obs" is not an observation response.
+        for chunk in chunks:
+            buffer += chunk
+            match = _JSON_OBS_PATTERN.search(buffer, search_start)
+            if match and match.end() < len(buffer):
+                break
+            if len(buffer) > _STREAM_HEADER_LIMIT:
+                raise RestError('No observations found in JSON received from WeatherFlow API: ' + buffer[:100])
+            # Rescan the tail in case the key was split across chunks
+            search_start = max(0, len(buffer) - _STREAM_OBS_KEY_LENGTH)
+        else:
+            raise RestError('No observations found in JSON received from WeatherFlow API: ' + buffer[:100])
+
+        type_match = _JSON_TYPE_PATTERN.search(buffer, 0, match.start())
+        if auto_add_data_keys and type_match and type_match.group(1) in REST_DATA_FORMAT:
+            value_names = REST_DATA_FORMAT[type_match.group(1)]['obs']
+
+        buffer = buffer[match.end():]
+        if buffer[0] == 'n':
+            # "obs": null means the device has no observations for the requested time
+            while len(buffer) < 4:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                buffer += chunk
+            if buffer.startswith('null'):
+                return
+        if buffer[0] != '[':
+            raise RestError('Issue parsing JSON received from WeatherFlow API, "obs" is not an array: ' + buffer[:100])
+
+        # Find the first element of the array to tell a list of observations from a single flat observation
+        position = 1
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n':
+                position += 1
+            if position < len(buffer):
+                break
+            chunk = next(chunks, None)
+            if chunk is None:
+                raise RestError('Issue parsing JSON received from WeatherFlow API, response ended early: ' +
+                                buffer[:100])
+            buffer += chunk
+
+        if buffer[position] not in '[]':
+            # A single observation is small, so decode it whole like add_data_keys does
+            while True:
+                try:
+                    observation, end = decoder.raw_decode(buffer)
+                    break
+                except ValueError:
+                    pass
+                if len(buffer) > _STREAM_HEADER_LIMIT:
+                    raise RestError('Issue parsing JSON received from WeatherFlow API: ' + buffer[:100])
+                chunk = next(chunks, None)
+                if chunk is None:
+                    raise RestError('Issue parsing JSON received from WeatherFlow API, response ended early: ' +
+                                    buffer[:100])
+                buffer += chunk
+            if value_names:
+                observation = convert_list(observation, value_names)
+            yield observation
+            return
+
+        # Decode each observation in the array, reading more of the body whenever an observation is incomplete
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position < len(buffer):
+                if buffer[position] == ']':
+                    return
+                if buffer[position] != '[':
+                    raise RestError('Issue parsing JSON received from WeatherFlow API, observation is not an array: ' +
+                                    buffer[position:position + 100])
+                try:
+                    observation, end = decoder.raw_decode(buffer, position)
+                    decoded = True
+                except ValueError:
+                    decoded = False
+                if decoded:
+                    position = end
+                    if value_names:
+                        observation = convert_list(observation, value_names)
+                    yield observation
+                    continue
+
+            buffer = buffer[position:]
+            position = 0
+            if len(buffer) > _STREAM_HEADER_LIMIT:
+                raise RestError('Issue parsing JSON received from WeatherFlow API: ' + buffer[:100])
+            chunk = next(chunks, None)
+            if chunk is None:
+                raise RestError('Issue parsing JSON received from WeatherFlow API, response ended early: ' +
+                                buffer[:100])
+            buffer += chunk
+
     def get_station_observation(self, station_id=None):
         """
         Get the latest federated observation for a Station. This observation is made from the latest Device
@@ -171,22 +398,24 @@ class Rest:
 
         return result
 
-    def _get(self, url, headers=None, params=None):
+    def _get(self, url, headers=None, params=None, stream=False):
         """
         Helper method to make REST call, this allows us to more gracefully deal with any errors
         :param url: URL to get
         :param headers: Request headers to pass
         :param params: Request parameters to pass on query string
+        :param stream: If true, the response body is not downloaded until it is iterated over
         :return: Results of request
         """
         try:
-            result = requests.get(url, headers=headers, params=params)
+            result = requests.get(url, headers=headers, params=params, stream=stream)
         except:
             raise RestError
 
         if result.status_code == 200:
             return result
         else:
+            result.close()
             raise RestError('WeatherFlow REST Get Error StatusCode=%s Reason=%s' % (result.status_code, result.reason))
 
     @staticmethod
@@ -212,5 +441,41 @@ class Rest:
         requests_log.propagate = True
 
 
+class ObservationStream:
+    def __init__(self, result, rows):
+        """
+        Iterator over streamed observations which owns the HTTP connection they are read from.  The connection is
+        closed when iteration finishes, on error, or when close() is called (also on leaving a with statement)
+        :param result: Streaming response from WeatherFlow API
+        :param rows: Generator of observations parsed from the response
+        """
+        self._result = result
+        self._rows = rows
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._rows)
+        except:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Stop streaming and close the HTTP connection
+        :return: Nothing
+        """
+        self._rows.close()
+        self._result.close()
+
+
 class RestError(Exception):
     pass